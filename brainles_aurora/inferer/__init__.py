@@ -1,2 +1,13 @@
 from .config import BaseConfig, AuroraInfererConfig
-from .inferer import AuroraInferer
+
+__all__ = ["BaseConfig", "AuroraInfererConfig", "AuroraInferer"]
+
+
+def __getattr__(name: str):
+    # the inferer imports torch, monai and nibabel which take seconds to import,
+    # defer them until the inferer is accessed so importing the config and constants stays cheap
+    if name == "AuroraInferer":
+        from .inferer import AuroraInferer
+
+        return AuroraInferer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
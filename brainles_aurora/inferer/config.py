@@ -1,8 +1,8 @@
 import logging
 from dataclasses import dataclass
-from typing import Tuple
+from typing import Optional, Tuple
 
-from brainles_aurora.inferer.constants import Device, ModelSelection
+from brainles_aurora.inferer.constants import Device, ModelSelection, Precision
 
 
 @dataclass
@@ -14,7 +14,7 @@ class BaseConfig:
     device: Device = Device.AUTO
     """Device for model inference. Defaults to Device.AUTO."""
     cuda_devices: str = "0"
-    """CUDA devices to use when using CUDA. Defaults to "0"."""
+    """CUDA devices to use when using CUDA, only effective if CUDA was not initialized before creating the inferer. Defaults to "0"."""
 
 
 @dataclass
@@ -23,8 +23,10 @@ class AuroraInfererConfig(BaseConfig):
 
     tta: bool = True
     """Whether to apply test-time augmentations. Defaults to True."""
-    sliding_window_batch_size: int = 1
-    """Batch size for sliding window inference. Defaults to 1."""
+    sliding_window_batch_size: Optional[int] = None
+    """Batch size for sliding window inference. If None, the batch size is determined from the free GPU memory (1 on CPU, a power of two with tensorrt to reuse the cached engine). Defaults to None."""
+    num_streams: int = 1
+    """Number of CUDA streams each sliding window batch is split across, allowing concurrent kernels of independent windows (ignored on CPU). Defaults to 1."""
     workers: int = 0
     """Number of workers for data loading. Defaults to 0."""
     threshold: float = 0.5
@@ -35,3 +37,13 @@ class AuroraInfererConfig(BaseConfig):
     """Crop size for sliding window inference. Defaults to (192, 192, 32)."""
     model_selection: ModelSelection = ModelSelection.BEST
     """Model selection strategy. Defaults to ModelSelection.BEST."""
+    precision: Precision = Precision.FP16
+    """Floating point precision for inference on GPU (CPU inference always uses full precision). Defaults to Precision.FP16."""
+    compile: bool = False
+    """Whether to compile the model with torch.compile for faster GPU inference (ignored on CPU). Compilation adds a one-time overhead to the first inference call. Defaults to False."""
+    tensorrt: bool = False
+    """Whether to compile the model with Torch-TensorRT for faster GPU inference (ignored on CPU). Requires the optional torch-tensorrt package, the compiled engine is cached next to the model weights. Defaults to False."""
+    half_precision_outputs: bool = False
+    """Whether to stitch the sliding window outputs in float16 instead of float32 for float16 mixed precision inference on GPU (Precision.FP16), halving the memory of the largest buffers at the cost of slightly less precise outputs. Defaults to False."""
+    compression_level: int = 1
+    """Gzip compression level (0-9) for .nii.gz output files, 0 only stores the data (fastest writes, largest files). Defaults to 1."""
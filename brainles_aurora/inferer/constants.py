@@ -82,5 +82,19 @@ class Device(str, Enum):
     """Attempt to use GPU, fallback to CPU."""
 
 
+class Precision(str, Enum):
+    """Enum representing the floating point precision used for model inference on GPU."""
+
+    FP32 = "float32"
+    """Full precision."""
+    FP16 = "float16"
+    """Mixed precision, autocast to float16."""
+    BF16 = "bfloat16"
+    """Mixed precision, autocast to bfloat16 (larger dynamic range than float16, requires an Ampere or newer GPU)."""
+
+
 WEIGHTS_DIR = "weights"
 """Directory name to store model weights."""
+
+INTENSITY_PERCENTILES = (0.5, 99.5)
+"""Lower and upper percentile of each input channel that are scaled to [0, 1] during preprocessing."""
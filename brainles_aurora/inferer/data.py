@@ -2,27 +2,38 @@ from __future__ import annotations
 
 import logging
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 import monai
 import nibabel as nib
 import numpy as np
+import torch
 from brainles_aurora.inferer.config import AuroraInfererConfig
-from brainles_aurora.inferer.constants import IMGS_TO_MODE_DICT, DataMode, InferenceMode
-from monai.data import list_data_collate
-from monai.transforms import (
-    Compose,
-    EnsureChannelFirstd,
-    Lambdad,
-    LoadImageD,
-    ScaleIntensityRangePercentilesd,
-    ToTensord,
+from brainles_aurora.inferer.constants import (
+    IMGS_TO_MODE_DICT,
+    INTENSITY_PERCENTILES,
+    DataMode,
+    InferenceMode,
+    Output,
 )
+from brainles_aurora.inferer.transforms import LoadNiftid, PreprocessImagesd
+from monai.data import ThreadDataLoader, list_data_collate
+from monai.transforms import Compose
 from torch.utils.data import DataLoader
 
 logger = logging.getLogger(__name__)
 
+NIFTI_EXTENSIONS = (".nii", ".nii.gz")
+"""Accepted file extensions of NIfTI input files."""
+
+# IMGS_TO_MODE_DICT indexed by a bitmask of the present modalities (bit i set if modality i in order [t1,t1c,t2,fla] is present)
+_MODE_TABLE = tuple(
+    IMGS_TO_MODE_DICT.get(tuple(bool(mask & (1 << i)) for i in range(4)))
+    for mask in range(16)
+)
+
 
 class DataHandler:
     """Class to perform data related tasks such as validation, loading, transformation, saving."""
@@ -33,6 +44,15 @@ class DataHandler:
         self.input_mode = None
         self.num_input_modalities = None
         self.reference_nifti_file = None
+        # result of the last validation, reused to avoid re-filtering the images
+        self._validated_images = None
+        self._not_none_images = None
+        # (path, modification time, affine, header) of the last parsed reference NIfTI file
+        self._reference_nifti_meta = None
+        # writes the output NIfTI files in parallel
+        self._save_executor = ThreadPoolExecutor(
+            max_workers=len(Output), thread_name_prefix="aurora_save"
+        )
 
     def get_input_mode(self) -> DataMode:
         """Get the input mode.
@@ -74,6 +94,23 @@ class DataHandler:
         ), "Reference NIfTI file not set. Please ensure you provided paths to NIfTI images and validated the input images first by calling .validate_images(...)."
         return self.reference_nifti_file
 
+    def _get_reference_affine_and_header(self) -> Tuple[np.ndarray, nib.Nifti1Header]:
+        """Get affine and header of the reference NIfTI file.
+        The header is only parsed once and reused for subsequent calls as long as the reference file is unchanged.
+
+        Returns:
+            Tuple[np.ndarray, nib.Nifti1Header]: Affine and header of the reference NIfTI file.
+        """
+        reference_file = self.get_reference_nifti_file()
+        mtime = os.stat(reference_file).st_mtime_ns
+        if self._reference_nifti_meta is None or self._reference_nifti_meta[:2] != (
+            reference_file,
+            mtime,
+        ):
+            ref = nib.load(reference_file)
+            self._reference_nifti_meta = (reference_file, mtime, ref.affine, ref.header)
+        return self._reference_nifti_meta[2:]
+
     def validate_images(
         self,
         t1: str | Path | np.ndarray | None = None,
@@ -98,6 +135,12 @@ class DataHandler:
         Raises:
             ValueError: If a file path is not a NIfTI file (.nii or .nii.gz).
         """
+        # reset the state derived from a previous validation, it must not outlive a failed validation
+        self.input_mode = None
+        self.num_input_modalities = None
+        self.reference_nifti_file = None
+        self._validated_images = None
+        self._not_none_images = None
 
         def _validate_image(
             data: str | Path | np.ndarray | None,
@@ -106,10 +149,13 @@ class DataHandler:
                 return None
             if isinstance(data, np.ndarray):
                 self.input_mode = DataMode.NUMPY
-                return data.astype(np.float32)
-            if not os.path.exists(data):
-                raise FileNotFoundError(f"File {data} not found")
-            if not (data.endswith(".nii.gz") or data.endswith(".nii")):
+                # no copy if the array already is a C-contiguous float32 array (the preprocessing never modifies it)
+                return np.ascontiguousarray(data, dtype=np.float32)
+            try:
+                os.stat(data)
+            except FileNotFoundError:
+                raise FileNotFoundError(f"File {data} not found") from None
+            if not str(data).endswith(NIFTI_EXTENSIONS):
                 raise ValueError(
                     f"File {data} must be a NIfTI file with extension .nii or .nii.gz"
                 )
@@ -133,6 +179,8 @@ class DataHandler:
             len(unique_types) == 1
         ), f"All passed images must be of the same type! Received {unique_types}. Accepted Input types: {list(DataMode)}"
         self.num_input_modalities = len(not_none_images)
+        self._validated_images = images
+        self._not_none_images = not_none_images
         if self.input_mode is DataMode.NIFTI_FILE:
             self.reference_nifti_file = not_none_images[0]
         logger.info(
@@ -161,7 +209,7 @@ class DataHandler:
             f"Received files: T1: {_t1}, T1C: {_t1c}, T2: {_t2}, FLAIR: {_flair}"
         )
         # check if files are given in a valid combination that has an existing model implementation
-        mode = IMGS_TO_MODE_DICT.get((_t1, _t1c, _t2, _flair), None)
+        mode = _MODE_TABLE[_t1 | _t1c << 1 | _t2 << 2 | _flair << 3]
         if mode is None:
             raise NotImplementedError(
                 f"No model implemented for this combination of images: T1: {_t1}, T1C: {_t1c}, T2: {_t2}, FLAIR: {_flair}. {os.linesep}Available models: {[mode.value for mode in InferenceMode]}"
@@ -170,48 +218,50 @@ class DataHandler:
         return mode
 
     def get_data_loader(
-        self, images: List[np.ndarray | None] | List[Path | None]
-    ) -> DataLoader:
+        self,
+        images: List[np.ndarray | None] | List[Path | None],
+        pin_memory: bool = False,
+        scale_intensities: bool = True,
+    ) -> DataLoader | List[Dict[str, torch.Tensor]]:
         """Get the data loader for inference.
+        Without workers, the single sample is preprocessed directly and returned as a list containing one batch.
 
         Args:
             images (List[np.ndarray | None] | List[Path | None]): List of validated images.
+            pin_memory (bool, optional): Whether to load the data into page-locked memory for faster (asynchronous) transfers to the GPU. Defaults to False.
+            scale_intensities (bool, optional): Whether to apply the percentile intensity scaling, disable if it is applied on the GPU instead. Defaults to True.
 
         Returns:
-            torch.utils.data.DataLoader: Data loader for inference.
+            DataLoader | List[Dict[str, torch.Tensor]]: Data loader for inference, or the single preprocessed batch if config.workers is 0.
         Raises:
             AssertionError: If the input mode is not set (i.e. input images were not validated)
         """
         assert (
             self.input_mode is not None
         ), "Input mode not set. Please validate the input images first by calling .validate_images(...)."
-        filtered_images = [img for img in images if img is not None]
+        filtered_images = (
+            self._not_none_images
+            if images is self._validated_images
+            else [img for img in images if img is not None]
+        )
+        # without workers the transforms directly write into page-locked memory, else the loader pins the batch
+        pin_transform_outputs = pin_memory and self.config.workers == 0
         # init transforms
         transforms = [
             (
-                LoadImageD(keys=["images"], image_only=True)
+                # loads directly as channel first array, no need for EnsureChannelFirstd
+                LoadNiftid(keys=["images"], pin_memory=pin_transform_outputs)
                 if self.input_mode == DataMode.NIFTI_FILE
                 else None
             ),
-            (
-                EnsureChannelFirstd(keys="images")
-                if (
-                    len(filtered_images) == 1 and self.input_mode == DataMode.NIFTI_FILE
-                )
-                else None
-            ),
-            Lambdad(["images"], np.nan_to_num),
-            ScaleIntensityRangePercentilesd(
+            # nan_to_num, percentile scaling and tensor conversion in a single pass
+            PreprocessImagesd(
                 keys="images",
-                lower=0.5,
-                upper=99.5,
-                b_min=0,
-                b_max=1,
-                clip=True,
-                relative=False,
-                channel_wise=True,
+                lower=INTENSITY_PERCENTILES[0],
+                upper=INTENSITY_PERCENTILES[1],
+                pin_memory=pin_transform_outputs,
+                scale_intensities=scale_intensities,
             ),
-            ToTensord(keys=["images"]),
         ]
         # Filter None transforms
         transforms = list(filter(None, transforms))
@@ -220,44 +270,96 @@ class DataHandler:
         data = {
             "images": filtered_images,
         }
+        if self.config.workers == 0:
+            # a data loader only adds overhead for a single sample, adding the batch dimension as a view also avoids the collate copy
+            images_tensor = inference_transforms(data)["images"].unsqueeze(0)
+            return [{"images": images_tensor}]
         # init dataset and dataloader
         inference_ds = monai.data.Dataset(
             data=[data],
             transform=inference_transforms,
         )
-        data_loader = DataLoader(
+        # thread workers avoid pickling the large image volumes between processes
+        data_loader = ThreadDataLoader(
             inference_ds,
+            use_thread_workers=True,
             batch_size=1,
             num_workers=self.config.workers,
             collate_fn=list_data_collate,
             shuffle=False,
+            pin_memory=pin_memory,
         )
         return data_loader
 
+    def _write_nifti(self, image: nib.Nifti1Image, output_file: str | Path) -> None:
+        """Write a NIfTI image, compressed with the configured compression level for .nii.gz files.
+
+        Args:
+            image (nib.Nifti1Image): NIfTI image.
+            output_file (str | Path): Output file path.
+        """
+        opener_kwargs = (
+            {"compresslevel": self.config.compression_level}
+            if str(output_file).endswith(".gz")
+            else {}
+        )
+        with nib.openers.Opener(str(output_file), "wb", **opener_kwargs) as f:
+            image.to_stream(f)
+
     def save_as_nifti(
-        self, postproc_data: Dict[str, np.ndarray], output_file_mapping: Dict[str, str]
-    ) -> None:
-        """Save post-processed data as NIFTI files.
+        self,
+        postproc_data: Dict[str, np.ndarray],
+        output_file_mapping: Dict[str, str],
+        wait: bool = True,
+    ) -> Dict[str, Future]:
+        """Save post-processed data as NIFTI files. The files are written concurrently in background threads.
 
         Args:
             postproc_data (Dict[str, np.ndarray]): Post-processed data.
             output_file_mapping (Dict[str,str]): Mapping of output keys to output file paths.
+            wait (bool, optional): Whether to wait for all files to be written. Else the returned futures have to be passed to wait_for_saves(...). Defaults to True.
+
+        Returns:
+            Dict[str, Future]: Futures of the writes per output key.
         """
         # determine affine/ header
         if self.get_input_mode() == DataMode.NIFTI_FILE:
-            reference_file = self.get_reference_nifti_file()
-            ref = nib.load(reference_file)
-            affine, header = ref.affine, ref.header
+            affine, header = self._get_reference_affine_and_header()
         else:
             logger.warning(
                 f"Writing NIFTI output after NumPy input, using default affine=np.eye(4) and header=None"
             )
             affine, header = np.eye(4), None
-        # save NIfTI files
+        # save NIfTI files concurrently (gzip compression releases the GIL)
+        futures = {}
         for key, data in postproc_data.items():
             output_file = output_file_mapping[key]
             if output_file:
                 output_image = nib.Nifti1Image(data, affine, header)
-                os.makedirs(os.path.dirname(output_file), exist_ok=True)
-                nib.save(output_image, output_file)
-                logger.info(f"Saved {key} to {output_file}")
+                parent_dir = os.path.dirname(output_file)
+                # create parent dir if the path is more than just a file name
+                if parent_dir:
+                    os.makedirs(parent_dir, exist_ok=True)
+                futures[key] = self._save_executor.submit(
+                    self._write_nifti, output_image, output_file
+                )
+        if wait:
+            self.wait_for_saves(
+                futures=futures, output_file_mapping=output_file_mapping
+            )
+        return futures
+
+    def wait_for_saves(
+        self, futures: Dict[str, Future], output_file_mapping: Dict[str, str]
+    ) -> None:
+        """Wait for the NIfTI files submitted by save_as_nifti(...) to be written.
+
+        Args:
+            futures (Dict[str, Future]): Futures of the writes per output key.
+            output_file_mapping (Dict[str,str]): Mapping of output keys to output file paths.
+        Raises:
+            Exception: Any exception raised while writing a file.
+        """
+        for key, future in futures.items():
+            future.result()
+            logger.info(f"Saved {key} to {output_file_mapping[key]}")
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import json
 import logging
+import logging.config
 import os
 import signal
 import sys
@@ -21,6 +22,22 @@ from brainles_aurora.utils.console_decorators import citation_reminder
 
 logger = logging.getLogger(__name__)
 
+_logging_configured = False
+
+
+def _configure_logging() -> None:
+    """Apply the logging config of the package once per process.\n
+    Reapplying it for every inferer would replace the root handlers and detach the log file handlers of other inferers.
+    """
+    global _logging_configured
+    if _logging_configured:
+        return
+    config_file = Path(__file__).parent / "log_config.json"
+    with open(config_file) as f_in:
+        log_config = json.load(f_in)
+    logging.config.dictConfig(log_config)
+    _logging_configured = True
+
 
 class AbstractInferer(ABC):
     """
@@ -44,6 +61,8 @@ class AbstractInferer(ABC):
         """
         if self.log_file_handler:
             logging.getLogger().removeHandler(self.log_file_handler)
+            # release the file descriptor of the previous log file
+            self.log_file_handler.close()
 
         parent_dir = os.path.dirname(log_file)
         # create parent dir if the path is more than just a file name
@@ -62,11 +81,9 @@ class AbstractInferer(ABC):
 
     def _setup_logger(self):
         """Setup the logger for the inferer and overwrite system hooks to add logging for exceptions and signals."""
-        config_file = Path(__file__).parent / "log_config.json"
-        with open(config_file) as f_in:
-            log_config = json.load(f_in)
-        logging.config.dictConfig(log_config)
-        logging.basicConfig(level=self.config.log_level)
+        _configure_logging()
+        # basicConfig would be a no-op since the root logger already has handlers
+        logging.getLogger().setLevel(self.config.log_level)
         self.log_file_handler = None
 
         # overwrite system hooks to log exceptions and signals (SIGINT, SIGTERM)
@@ -126,12 +143,22 @@ class AuroraInferer(AbstractInferer):
         if self.config.device == Device.CPU:
             device = torch.device("cpu")
         if self.config.device == Device.AUTO or self.config.device == Device.GPU:
-            # The env vars have to be set ebfore the first call to torch.cuda, else torch will always attempt to use the first device
+            # The env vars have to be set before the first call to torch.cuda, else torch will always attempt to use the first device
+            if (
+                torch.cuda.is_initialized()
+                and os.environ.get("CUDA_VISIBLE_DEVICES") != self.config.cuda_devices
+            ):
+                logger.warning(
+                    f"CUDA was already initialized before configuring the inferer, setting CUDA_VISIBLE_DEVICES to {self.config.cuda_devices} has no effect. "
+                    "Create the inferer before any other CUDA usage or set CUDA_VISIBLE_DEVICES before starting Python."
+                )
             os.environ["CUDA_DEVICE_ORDER"] = "PCI_BUS_ID"
             os.environ["CUDA_VISIBLE_DEVICES"] = self.config.cuda_devices
             if torch.cuda.is_available():
                 # clean memory
                 torch.cuda.empty_cache()
+                # let cuDNN select the fastest convolution algorithms for the fixed crop size
+                torch.backends.cudnn.benchmark = True
                 device = torch.device("cuda")
                 logger.info(
                     f"Set CUDA_VISIBLE_DEVICES to {os.environ['CUDA_VISIBLE_DEVICES']}"
@@ -204,7 +231,13 @@ class AuroraInferer(AbstractInferer):
         )
 
         logger.info("Setting up Dataloader")
-        data_loader = self.data_handler.get_data_loader(images=validated_images)
+        # on GPU the percentile intensity scaling is applied after the transfer to the device
+        scale_on_device = self.device.type == "cuda"
+        data_loader = self.data_handler.get_data_loader(
+            images=validated_images,
+            pin_memory=self.device.type == "cuda",
+            scale_intensities=not scale_on_device,
+        )
 
         # setup output file paths
         output_file_mapping = {
@@ -214,14 +247,21 @@ class AuroraInferer(AbstractInferer):
         }
 
         logger.info(f"Running inference on device := {self.device}")
-        out = self.model_handler.infer(data_loader=data_loader)
+        out = self.model_handler.infer(
+            data_loader=data_loader, scale_intensities=scale_on_device
+        )
         logger.info(f"Finished inference")
 
         # save data to fie if paths are provided
+        save_futures = {}
         if any(output_file_mapping.values()):
             logger.info("Saving post-processed data as NIfTI files")
-            self.data_handler.save_as_nifti(
-                postproc_data=out, output_file_mapping=output_file_mapping
+            save_futures = self.data_handler.save_as_nifti(
+                postproc_data=out, output_file_mapping=output_file_mapping, wait=False
             )
+        # the files are written in the background, only wait for them right before returning
+        self.data_handler.wait_for_saves(
+            futures=save_futures, output_file_mapping=output_file_mapping
+        )
         logger.info(f"{' Finished inference run ':=^80}")
         return out
@@ -1,23 +1,74 @@
 from __future__ import annotations
 
 import logging
+import math
 import os
+import tempfile
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Dict
+from typing import Callable, Dict, List
 
 import numpy as np
 import torch
 from brainles_aurora.inferer.config import AuroraInfererConfig
-from brainles_aurora.inferer.constants import InferenceMode, Output, WEIGHTS_DIR
+from brainles_aurora.inferer.constants import (
+    INTENSITY_PERCENTILES,
+    InferenceMode,
+    Output,
+    Precision,
+    WEIGHTS_DIR,
+)
 from brainles_aurora.inferer.data import DataHandler
+from brainles_aurora.inferer.sliding_window import MultiStreamSlidingWindowInferer
+from brainles_aurora.inferer.transforms import scale_intensity_percentiles_
 from brainles_aurora.utils import download_model_weights
-from monai.inferers import SlidingWindowInferer
+from monai.data.utils import compute_importance_map
 from monai.networks.nets import BasicUNet
 from monai.transforms import RandGaussianNoised
 from torch.utils.data import DataLoader
 
 logger = logging.getLogger(__name__)
 
+TTA_FLIP_DIMS = [[2], [3]]
+"""Dimensions (of the BCHWD input) that are flipped for test time augmentations."""
+
+TTA_NOISE_DRAWS = 4
+"""Number of noisy copies of the input used for test time augmentations, each inferred as is and flipped along TTA_FLIP_DIMS."""
+
+# measured on CPU with the torch profiler (profile_memory=True) as the peak of the live allocations of a single full precision
+# forward pass of the 4 modality model under inference_mode: 1066 bytes per voxel for 32^3, 64^3 and the default
+# 192x192x32 crop size (1.26 GB per window), rounded up to leave headroom for cuDNN workspaces
+WINDOW_BYTES_PER_VOXEL = 1152
+"""Estimated peak GPU memory of the model's full precision forward pass per window voxel, used to determine the sliding window batch size."""
+
+AUTO_BATCH_MEMORY_FRACTION = 0.5
+"""Fraction of the free GPU memory used for the windows of a batch when determining the sliding window batch size, the rest is left for the stitched outputs."""
+
+MAX_AUTO_SW_BATCH_SIZE = 32
+"""Upper bound for the automatically determined sliding window batch size."""
+
+
+def _save_atomically(save: Callable[[str], None], path: Path) -> None:
+    """Save a file atomically: write it to a unique temporary file in the target folder and move it into place.
+    A partially written file is never visible under the target path, concurrent writers do not interleave.
+
+    Args:
+        save (Callable[[str], None]): Function writing the file to the given path.
+        path (Path): Target path.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+    )
+    os.close(fd)
+    try:
+        save(tmp_path)
+        # mkstemp creates the file readable by the owner only
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 
 class ModelHandler:
     """Class for model loading, inference and post processing"""
@@ -39,6 +90,15 @@ class ModelHandler:
         # Will be set during infer() call
         self.model = None
         self.inference_mode = None
+        self.sliding_window_batch_size = None
+        # settings the sliding window batch size (and a TensorRT engine compiled for it) was determined with
+        self._batch_size_settings = None
+        # (configured, effective) precision, resolved once to not repeat the fallback warning
+        self._resolved_precision = None
+        # (crop size, gaussian importance map) shared by all sliding window inferers
+        self._importance_map = None
+        # sliding window inferers (and their CUDA streams) reused across infer() calls
+        self._inferers = {}
         # download weights if not present
         self.lib_path: str = Path(os.path.dirname(os.path.abspath(__file__)))
         self.model_weights_folder = self.lib_path.parent / WEIGHTS_DIR
@@ -48,17 +108,33 @@ class ModelHandler:
     def load_model(
         self, inference_mode: InferenceMode, num_input_modalities: int
     ) -> None:
-        """Load the model based on the inference mode. Will reuse previously loaded model if inference mode is the same.
+        """Load the model based on the inference mode. Will reuse previously loaded model if inference mode and the settings determining the sliding window batch size are the same.
 
         Args:
             inference_mode (InferenceMode): Inference mode
             num_input_modalities (int): Number of input modalities (range 1-4)
         """
-        if not self.model or self.inference_mode != inference_mode:
+        batch_size_settings = (
+            self.config.sliding_window_batch_size,
+            self.config.tta,
+            tuple(self.config.crop_size),
+            self.config.precision,
+        )
+        if (
+            not self.model
+            or self.inference_mode != inference_mode
+            or self._batch_size_settings != batch_size_settings
+        ):
             logger.info(
                 f"No loaded compatible model found (Switching from {self.inference_mode} to {inference_mode}). Loading Model and weights..."
             )
             self.inference_mode = inference_mode
+            self._batch_size_settings = batch_size_settings
+            # release the previous model and the memory cached from previous inferences before estimating the free GPU memory
+            self.model = None
+            if self.device.type == "cuda":
+                torch.cuda.empty_cache()
+            self.sliding_window_batch_size = self._determine_sliding_window_batch_size()
             self.model = self._load_model(num_input_modalities=num_input_modalities)
             logger.info(f"Successfully loaded model.")
         else:
@@ -66,6 +142,39 @@ class ModelHandler:
                 f"Same inference mode ({self.inference_mode}) as previous infer call. Re-using loaded model"
             )
 
+    def _determine_sliding_window_batch_size(self) -> int:
+        """Determine the sliding window batch size. Unless configured, the batch size is estimated from the free GPU memory.
+
+        Returns:
+            int: Sliding window batch size.
+        """
+        if self.config.sliding_window_batch_size is not None:
+            return self.config.sliding_window_batch_size
+        if self.device.type != "cuda":
+            # larger batches do not speed up CPU inference
+            return 1
+        free_memory, _ = torch.cuda.mem_get_info(self.device)
+        # blocks cached by PyTorch's allocator are free for its allocations but counted as used by the driver
+        reserved_memory = torch.cuda.memory_reserved(self.device)
+        free_memory += reserved_memory - torch.cuda.memory_allocated(self.device)
+        window_bytes = math.prod(self.config.crop_size) * WINDOW_BYTES_PER_VOXEL
+        if self.config.precision != Precision.FP32:
+            window_bytes //= 2
+        # test time augmentations infer the windows of all flipped views together
+        views = 1 + len(TTA_FLIP_DIMS) if self.config.tta else 1
+        sw_batch_size = int(
+            free_memory * AUTO_BATCH_MEMORY_FRACTION // (window_bytes * views)
+        )
+        sw_batch_size = max(1, min(sw_batch_size, MAX_AUTO_SW_BATCH_SIZE))
+        if self.config.tensorrt:
+            # TensorRT engines are compiled for and cached by the batch size, rounding down to a power of two
+            # reuses the cached engine across runs with (slightly) different free GPU memory
+            sw_batch_size = 2 ** (sw_batch_size.bit_length() - 1)
+        logger.info(
+            f"Using sliding window batch size {sw_batch_size} ({free_memory / 2**30:.1f} GiB free GPU memory)"
+        )
+        return sw_batch_size
+
     def _load_model(self, num_input_modalities: int) -> torch.nn.Module:
         """Internal method to load the Aurora model based on the inference mode.
         Args:
@@ -91,49 +200,247 @@ class ModelHandler:
             raise NotImplementedError(
                 f"No weights found for model {self.inference_mode} and selection {self.config.model_selection}. {os.linesep}Available models: {[mode.value for mode in InferenceMode]}"
             )
+        state_dict = self._load_state_dict(weights_path=weights_path)
+        # assign the (memory mapped) checkpoint tensors instead of copying them into the initialized parameters
+        model.load_state_dict(state_dict, assign=True)
         model = model.to(self.device)
-        checkpoint = torch.load(weights_path, map_location=self.device)
-        # The models were trained using DataParallel, hence we need to remove the 'module.' prefix
-        # for cpu inference to enable checkpoint loading (since DataParallel is not usable for CPU)
-        if self.device == torch.device("cpu"):
-            if "module." in list(checkpoint["model_state"].keys())[0]:
-                checkpoint["model_state"] = {
-                    k.replace("module.", ""): v
-                    for k, v in checkpoint["model_state"].items()
-                }
-        else:
-            model = torch.nn.parallel.DataParallel(model)
-        model.load_state_dict(checkpoint["model_state"])
+        if self.device.type == "cuda":
+            # cuDNN dispatches faster (tensor core) Conv3d kernels for channels last inputs
+            model = model.to(memory_format=torch.channels_last_3d)
+        if self.config.tensorrt and self.device.type == "cuda":
+            trt_model = self._load_tensorrt_model(
+                model=model, num_input_modalities=num_input_modalities
+            )
+            if trt_model is not None:
+                return trt_model
+        # DataParallel only pays off when splitting batches across multiple GPUs,
+        # on a single device it only adds scatter/gather overhead to every forward pass
+        # (multiple configured devices might not all be visible, e.g. if CUDA_VISIBLE_DEVICES could not be applied)
+        if (
+            self.device.type == "cuda"
+            and len(self.config.cuda_devices.split(",")) > 1
+            and torch.cuda.device_count() > 1
+        ):
+            if self.config.compile:
+                logger.warning(
+                    "torch.compile is not supported in combination with DataParallel (multiple CUDA devices), skipping compilation"
+                )
+            return torch.nn.parallel.DataParallel(model)
+        if self.config.compile and self.device.type == "cuda":
+            # sliding window inference always feeds patches of the same roi size and only a few distinct batch sizes
+            # (full and remainder batches, test time augmentations), dynamic=False compiles one static graph per batch size
+            # which "reduce-overhead" can capture with CUDA graphs
+            mode = "reduce-overhead"
+            if self.config.num_streams > 1:
+                # the sub-batches of a window batch are inferred on different streams and only concatenated afterwards,
+                # replaying the same CUDA graph for each sub-batch would overwrite the outputs of the previous one
+                logger.warning(
+                    "CUDA graphs are not supported in combination with multiple CUDA streams, compiling without CUDA graphs"
+                )
+                mode = "default"
+            logger.info("Compiling model with torch.compile")
+            model = torch.compile(model, mode=mode, fullgraph=False, dynamic=False)
         return model
 
+    def _load_state_dict(self, weights_path: str | Path) -> Dict[str, torch.Tensor]:
+        """Load the model state dict from a checkpoint.
+        If the optional safetensors package is installed, the state dict is cached next to the checkpoint
+        and subsequently loaded from the cache directly to the device.
+
+        Args:
+            weights_path (str | Path): Path to the checkpoint.
+
+        Returns:
+            Dict[str, torch.Tensor]: Model state dict without the DataParallel 'module.' prefix.
+        """
+        try:
+            import safetensors.torch
+        except ImportError:
+            safetensors = None
+        cache_path = Path(weights_path).with_suffix(".safetensors")
+        if (
+            safetensors is not None
+            and cache_path.exists()
+            and cache_path.stat().st_mtime >= os.stat(weights_path).st_mtime
+        ):
+            try:
+                logger.debug(f"Loading cached state dict from {cache_path}")
+                return safetensors.torch.load_file(cache_path, device=str(self.device))
+            except (safetensors.SafetensorError, OSError) as e:
+                # e.g. a corrupt cache, it is replaced by the state dict of the checkpoint
+                logger.warning(
+                    f"Failed to load cached state dict from {cache_path} ({e}), loading the checkpoint instead."
+                )
+
+        checkpoint = self._load_checkpoint(weights_path=weights_path)
+        state_dict = checkpoint["model_state"]
+        # The models were trained using DataParallel, hence we need to remove the 'module.' prefix
+        # to load the checkpoint into the plain model
+        if "module." in next(iter(state_dict)):
+            state_dict = {k.replace("module.", "", 1): v for k, v in state_dict.items()}
+        if safetensors is not None:
+            try:
+                # a partially written cache must never be loaded, also with concurrent processes
+                _save_atomically(
+                    lambda path: safetensors.torch.save_file(state_dict, path),
+                    path=cache_path,
+                )
+                logger.debug(f"Cached state dict in {cache_path}")
+            except (OSError, ValueError) as e:
+                # e.g. read-only weights folder, the checkpoint is loaded again next time
+                logger.warning(f"Failed to cache state dict in {cache_path}: {e}")
+        return state_dict
+
+    def _load_checkpoint(self, weights_path: str | Path) -> Dict:
+        """Load a model checkpoint to CPU memory.
+        The checkpoint is memory mapped if possible and always restricted to tensors and primitive types.
+
+        Args:
+            weights_path (str | Path): Path to the checkpoint.
+
+        Returns:
+            Dict: Checkpoint.
+        """
+        try:
+            return torch.load(
+                weights_path, map_location="cpu", mmap=True, weights_only=True
+            )
+        except (RuntimeError, TypeError) as e:
+            # legacy (non zip) checkpoints can not be memory mapped
+            # checkpoints containing other objects are rejected (pickle.UnpicklingError) instead of being unpickled
+            logger.debug(f"Falling back to checkpoint loading without mmap: {e}")
+            return torch.load(weights_path, map_location="cpu", weights_only=True)
+
+    def _load_tensorrt_model(
+        self, model: torch.nn.Module, num_input_modalities: int
+    ) -> torch.nn.Module | None:
+        """Compile the model with Torch-TensorRT. A previously compiled engine for the same setup is loaded from disk instead.
+
+        Args:
+            model (torch.nn.Module): Aurora model with loaded weights.
+            num_input_modalities (int): Number of input modalities (range 1-4)
+
+        Returns:
+            torch.nn.Module | None: TensorRT compiled model or None if Torch-TensorRT is not available.
+        """
+        try:
+            import torch_tensorrt
+        except ImportError:
+            logger.warning(
+                "Torch-TensorRT is not installed (pip install torch-tensorrt), falling back to PyTorch inference."
+            )
+            return None
+
+        sw_batch_size = self.sliding_window_batch_size
+        # test time augmentations batch the windows of all views together
+        max_sw_batch_size = sw_batch_size * (1 + len(TTA_FLIP_DIMS))
+        # engines are specific to the GPU architecture
+        major, minor = torch.cuda.get_device_capability(self.device)
+        input_dtype = self._get_input_dtype()
+        engine_file = self.model_weights_folder / (
+            f"{self.inference_mode}_{self.config.model_selection}"
+            f"_sm{major}{minor}_{self.config.precision}_{str(input_dtype).split('.')[-1]}"
+            f"_{max_sw_batch_size}x{'x'.join(map(str, self.config.crop_size))}.ts"
+        )
+        if engine_file.exists():
+            try:
+                logger.info(f"Loading TensorRT engine from {engine_file}")
+                return torch.jit.load(str(engine_file), map_location=self.device)
+            except RuntimeError as e:
+                logger.warning(f"Failed to load TensorRT engine ({e}), recompiling.")
+
+        logger.info("Compiling model with Torch-TensorRT. This might take a while...")
+        patch_shape = (num_input_modalities, *self.config.crop_size)
+        trt_model = torch_tensorrt.compile(
+            model,
+            ir="ts",
+            inputs=[
+                torch_tensorrt.Input(
+                    min_shape=(1, *patch_shape),
+                    opt_shape=(sw_batch_size, *patch_shape),
+                    max_shape=(max_sw_batch_size, *patch_shape),
+                    dtype=input_dtype,
+                )
+            ],
+            # the precision autocast falls back to if bfloat16 is not supported
+            enabled_precisions={
+                torch.float32,
+                self._get_autocast_dtype() or torch.float32,
+            },
+        )
+        try:
+            _save_atomically(
+                lambda path: torch.jit.save(trt_model, path), path=engine_file
+            )
+            logger.info(f"Saved TensorRT engine to {engine_file}")
+        except OSError as e:
+            # e.g. read-only weights folder, the model is compiled again next time
+            logger.warning(f"Failed to save TensorRT engine to {engine_file}: {e}")
+        return trt_model
+
     def _apply_test_time_augmentations(
-        self, outputs: torch.Tensor, data: Dict, inferer: SlidingWindowInferer
+        self, outputs: torch.Tensor, inputs: torch.Tensor
     ) -> torch.Tensor:
         """Apply test time augmentations to the model outputs.
 
         Args:
             outputs (torch.Tensor): Model outputs.
-            data (Dict): Input data.
-            inferer (SlidingWindowInferer): Sliding window inferer.
+            inputs (torch.Tensor): Preprocessed model inputs.
 
         Returns:
             torch.Tensor: Augmented model outputs.
         """
-        n = 1.0
-        for _ in range(4):
+        views_per_draw = 1 + len(TTA_FLIP_DIMS)
+        # the window batch size still determines the peak memory, windows of different views are batched together
+        inferer = self._get_sliding_window_inferer(
+            sw_batch_size=self.sliding_window_batch_size * views_per_draw
+        )
+        # all views are written into a single buffer instead of being collected and concatenated
+        views = torch.empty(
+            (TTA_NOISE_DRAWS * views_per_draw, *inputs.shape[1:]),
+            dtype=inputs.dtype,
+            device=inputs.device,
+        )
+        reversed_indices = {
+            dim: torch.arange(inputs.shape[dim] - 1, -1, -1, device=inputs.device)
+            for dims in TTA_FLIP_DIMS
+            for dim in dims
+        }
+        for draw in range(TTA_NOISE_DRAWS):
             # test time augmentations
-            _img = RandGaussianNoised(keys="images", prob=1.0, std=0.001)(data)[
-                "images"
-            ]
-            output = inferer(_img, self.model)
-            outputs += output
-            n += 1.0
-            for dims in [[2], [3]]:
-                flip_pred = inferer(torch.flip(_img, dims=dims), self.model)
-                output = torch.flip(flip_pred, dims=dims)
-                outputs += output
-                n += 1.0
-        outputs /= n
+            _img = views[draw * views_per_draw].unsqueeze(0)
+            # the noise is float32, keep the dtype of the inputs for the stitched outputs
+            _img.copy_(
+                RandGaussianNoised(keys="images", prob=1.0, std=0.001)(
+                    {"images": inputs}
+                )["images"]
+            )
+            for i, dims in enumerate(TTA_FLIP_DIMS, start=1):
+                flipped = views[draw * views_per_draw + i].unsqueeze(0)
+                if len(dims) == 1:
+                    # gathering the reversed indices writes the flipped view without an intermediate copy
+                    torch.index_select(
+                        _img, dims[0], reversed_indices[dims[0]], out=flipped
+                    )
+                else:
+                    flipped.copy_(torch.flip(_img, dims=dims))
+        # infer all views in a single batched sliding window pass
+        preds = inferer(views, self.model)
+        del views
+        preds = preds.view(TTA_NOISE_DRAWS, views_per_draw, *preds.shape[1:])
+        view_sum = preds[:, 0].sum(dim=0, keepdim=True)
+        outputs += view_sum
+        for i, dims in enumerate(TTA_FLIP_DIMS, start=1):
+            # flipping is linear, un-flip the sum of the draws once
+            torch.sum(preds[:, i], dim=0, keepdim=True, out=view_sum)
+            if len(dims) == 1:
+                # adding at the reversed indices un-flips the sum without a copy, the views may be on the host
+                outputs.index_add_(
+                    dims[0], reversed_indices[dims[0]].to(outputs.device), view_sum
+                )
+            else:
+                outputs += torch.flip(view_sum, dims=dims)
+        outputs /= 1 + TTA_NOISE_DRAWS * views_per_draw
         return outputs
 
     def _post_process(
@@ -148,20 +455,21 @@ class ModelHandler:
             Dict[str, np.ndarray]: Post-processed data.
         """
         # create segmentations
-        activated_outputs = (
-            (onehot_model_outputs_CHWD[0][:, :, :, :].sigmoid()).detach().cpu().numpy()
+        # sigmoid is monotonic: thresholding the logits is equivalent and skips the full volume sigmoid
+        threshold = self.config.threshold
+        if 0 < threshold < 1:
+            binarized = onehot_model_outputs_CHWD[0] >= math.log(
+                threshold / (1 - threshold)
+            )
+        else:
+            binarized = onehot_model_outputs_CHWD[0].sigmoid() >= threshold
+        whole, enhancing = binarized.to(torch.uint8)
+        # final seg: edema (1) where whole, enhancing (2) where enhancing
+        final = whole.masked_fill(enhancing.bool(), 2)
+        # build all outputs on the model's device, a single uint8 transfer to the host
+        final_seg, whole_out, enhancing_out = (
+            torch.stack([final, whole, enhancing]).cpu().numpy()
         )
-        binarized_outputs = activated_outputs >= self.config.threshold
-        binarized_outputs = binarized_outputs.astype(np.uint8)
-        # output channles
-        whole_metastasis = binarized_outputs[0]
-        enhancing_metastasis = binarized_outputs[1]
-        # final seg
-        final_seg = whole_metastasis.copy()
-        final_seg[whole_metastasis == 1] = 1  # edema
-        final_seg[enhancing_metastasis == 1] = 2  # enhancing
-        whole_out = binarized_outputs[0]
-        enhancing_out = binarized_outputs[1]
         # create output dict based on config
         return {
             Output.SEGMENTATION: final_seg,
@@ -169,39 +477,154 @@ class ModelHandler:
             Output.METASTASIS_NETWORK: enhancing_out,
         }
 
-    def _sliding_window_inference(
-        self, data_loader: DataLoader
-    ) -> Dict[str, np.ndarray]:
-        """Perform sliding window inference using monai.inferers.SlidingWindowInferer.
+    def _get_importance_map(self) -> torch.Tensor:
+        """Get the gaussian importance map used to blend the sliding windows. Computed once on the device and reused.
+
+        Returns:
+            torch.Tensor: Importance map with the shape of the crop size.
+        """
+        crop_size = tuple(self.config.crop_size)
+        if self._importance_map is None or self._importance_map[0] != crop_size:
+            self._importance_map = (
+                crop_size,
+                compute_importance_map(crop_size, mode="gaussian", device=self.device),
+            )
+        return self._importance_map[1]
+
+    def _get_sliding_window_inferer(
+        self, sw_batch_size: int
+    ) -> MultiStreamSlidingWindowInferer:
+        """Get a sliding window inferer for the configured crop size and overlap.
+        Inferers are cached and only recreated if the crop size, batch size, overlap or number of streams changed.
 
         Args:
-            data_loader (DataLoader): Data loader.
+            sw_batch_size (int): Number of windows to infer in one batch.
 
         Returns:
-            Dict[str, np.ndarray]: Post-processed data
+            MultiStreamSlidingWindowInferer: Sliding window inferer.
         """
-        inferer = SlidingWindowInferer(
+        key = (
+            tuple(self.config.crop_size),
+            sw_batch_size,
+            self.config.sliding_window_overlap,
+            self.config.num_streams,
+        )
+        if key not in self._inferers:
+            self._inferers[key] = self._create_sliding_window_inferer(
+                sw_batch_size=sw_batch_size
+            )
+        return self._inferers[key]
+
+    def _create_sliding_window_inferer(
+        self, sw_batch_size: int
+    ) -> MultiStreamSlidingWindowInferer:
+        """Create a sliding window inferer for the configured crop size and overlap.
+
+        Args:
+            sw_batch_size (int): Number of windows to infer in one batch.
+
+        Returns:
+            MultiStreamSlidingWindowInferer: Sliding window inferer.
+        """
+        return MultiStreamSlidingWindowInferer(
             roi_size=self.config.crop_size,  # = patch_size
-            sw_batch_size=self.config.sliding_window_batch_size,
+            sw_batch_size=sw_batch_size,
             sw_device=self.device,
             device=self.device,
             overlap=self.config.sliding_window_overlap,
             mode="gaussian",
             padding_mode="replicate",
+            num_streams=self.config.num_streams,
+            roi_weight_map=self._get_importance_map(),
+            memory_format=(
+                torch.channels_last_3d if self.device.type == "cuda" else None
+            ),
+        )
+
+    def _get_autocast_dtype(self) -> torch.dtype | None:
+        """Get the autocast dtype for the configured precision. Mixed precision is only used on GPU.
+
+        Returns:
+            torch.dtype | None: Autocast dtype, or None for full precision.
+        """
+        if self.device.type != "cuda" or self.config.precision == Precision.FP32:
+            return None
+        if (
+            self._resolved_precision is None
+            or self._resolved_precision[0] != self.config.precision
+        ):
+            precision = self.config.precision
+            if precision == Precision.BF16 and not torch.cuda.is_bf16_supported():
+                logger.warning(
+                    f"{Precision.BF16} is not supported by the GPU, falling back to {Precision.FP16}"
+                )
+                precision = Precision.FP16
+            self._resolved_precision = (self.config.precision, precision)
+        return getattr(torch, self._resolved_precision[1])
+
+    def _get_input_dtype(self) -> torch.dtype:
+        """Get the dtype of the model inputs. The sliding window inferer stitches the outputs in the dtype of the inputs.
+
+        Returns:
+            torch.dtype: float16 if half precision outputs are enabled for float16 mixed precision inference, else float32.
+        """
+        # not for bfloat16, its 8 bit mantissa is too coarse for accumulating the outputs
+        if (
+            self.config.half_precision_outputs
+            and self._get_autocast_dtype() == torch.float16
+        ):
+            return torch.float16
+        return torch.float32
+
+    def _autocast(self) -> torch.autocast | nullcontext:
+        """Get the autocast context for the configured precision. Mixed precision is only used on GPU.
+
+        Returns:
+            torch.autocast | nullcontext: Autocast context, or a no-op context for full precision.
+        """
+        autocast_dtype = self._get_autocast_dtype()
+        if autocast_dtype is None:
+            return nullcontext()
+        return torch.autocast(device_type=self.device.type, dtype=autocast_dtype)
+
+    def _sliding_window_inference(
+        self,
+        data_loader: DataLoader | List[Dict[str, torch.Tensor]],
+        scale_intensities: bool = False,
+    ) -> Dict[str, np.ndarray]:
+        """Perform sliding window inference using monai.inferers.SlidingWindowInferer.
+
+        Args:
+            data_loader (DataLoader | List[Dict[str, torch.Tensor]]): Data loader or list of preprocessed batches.
+            scale_intensities (bool, optional): Whether to apply the percentile intensity scaling on the device (if not done by the data loader). Defaults to False.
+
+        Returns:
+            Dict[str, np.ndarray]: Post-processed data
+        """
+        inferer = self._get_sliding_window_inferer(
+            sw_batch_size=self.sliding_window_batch_size
         )
 
-        with torch.no_grad():
+        with torch.inference_mode(), self._autocast():
+            # the model is moved to the device when it is loaded
             self.model.eval()
-            self.model = self.model.to(self.device)
             # currently always only 1 batch! TODO: potentialy add support to pass multiple image tuples at once?
             for data in data_loader:
-                inputs = data["images"].to(self.device)
+                # asynchronous if the data loader provides page-locked memory
+                inputs = data["images"].to(self.device, non_blocking=True)
+                if scale_intensities:
+                    scale_intensity_percentiles_(
+                        inputs,
+                        lower=INTENSITY_PERCENTILES[0],
+                        upper=INTENSITY_PERCENTILES[1],
+                    )
+                # no-op unless the outputs are stitched in half precision
+                inputs = inputs.to(self._get_input_dtype())
                 outputs = inferer(inputs, self.model)
                 if self.config.tta:
                     logger.info("Applying test time augmentations")
-                    outputs = self._apply_test_time_augmentations(
-                        outputs, data, inferer
-                    )
+                    # the augmented views are kept in host memory to not multiply the GPU memory usage
+                    outputs = self._apply_test_time_augmentations(outputs, inputs.cpu())
                 logger.info("Post-processing data")
                 postprocessed_data = self._post_process(
                     onehot_model_outputs_CHWD=outputs,
@@ -209,13 +632,20 @@ class ModelHandler:
                 logger.info("Returning post-processed data as Dict of Numpy arrays")
                 return postprocessed_data
 
-    def infer(self, data_loader: DataLoader) -> Dict[str, np.ndarray]:
+    def infer(
+        self,
+        data_loader: DataLoader | List[Dict[str, torch.Tensor]],
+        scale_intensities: bool = False,
+    ) -> Dict[str, np.ndarray]:
         """Perform aurora inference on the given data_loader.
 
         Args:
-            data_loader (DataLoader): data loader
+            data_loader (DataLoader | List[Dict[str, torch.Tensor]]): data loader or list of preprocessed batches
+            scale_intensities (bool, optional): Whether to apply the percentile intensity scaling on the device (if not done by the data loader). Defaults to False.
 
         Returns:
             Dict[str, np.ndarray]: Post-processed data
         """
-        return self._sliding_window_inference(data_loader=data_loader)
+        return self._sliding_window_inference(
+            data_loader=data_loader, scale_intensities=scale_intensities
+        )
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from functools import partial
+from typing import Any, Callable, List
+
+import torch
+from monai.inferers import SlidingWindowInferer
+
+
+class MultiStreamSlidingWindowInferer(SlidingWindowInferer):
+    """Sliding window inferer that splits each batch of windows across multiple CUDA streams.\n
+    The windows of a batch are independent, hence the kernels of the sub-batches can run concurrently
+    when a single (small) batch does not saturate the GPU. Behaves like monai's SlidingWindowInferer on CPU or with a single stream.
+    Optionally passes the windows to the network in a specific memory format (e.g. channels last).
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        num_streams: int = 1,
+        roi_weight_map: torch.Tensor | None = None,
+        memory_format: torch.memory_format | None = None,
+        **kwargs: Any,
+    ) -> None:
+        """Initialize the inferer.
+
+        Args:
+            *args (Any): Positional arguments for monai.inferers.SlidingWindowInferer.
+            num_streams (int, optional): Number of CUDA streams to split the window batches across. Defaults to 1.
+            roi_weight_map (torch.Tensor | None, optional): Precomputed importance map for blending the windows, shared between inferers with the same roi size and mode. Defaults to None (computed by monai).
+            memory_format (torch.memory_format | None, optional): Memory format the windows are converted to before being passed to the network. Defaults to None (unchanged).
+            **kwargs (Any): Keyword arguments for monai.inferers.SlidingWindowInferer.
+        """
+        super().__init__(*args, **kwargs)
+        self.num_streams = num_streams
+        self.memory_format = memory_format
+        if roi_weight_map is not None:
+            self.roi_weight_map = roi_weight_map
+        self.streams: List[torch.cuda.Stream] = []
+
+    def __call__(
+        self,
+        inputs: torch.Tensor,
+        network: Callable[..., torch.Tensor],
+        *args: Any,
+        **kwargs: Any,
+    ) -> torch.Tensor:
+        """Run sliding window inference.
+
+        Args:
+            inputs (torch.Tensor): Model input data for inference.
+            network (Callable[..., torch.Tensor]): Target model to execute inference.
+            *args (Any): Optional args to be passed to network.
+            **kwargs (Any): Optional keyword args to be passed to network.
+
+        Returns:
+            torch.Tensor: Stitched model outputs.
+        """
+        sw_device = torch.device(self.sw_device or inputs.device)
+        if self.num_streams > 1 and sw_device.type == "cuda" and not self.streams:
+            self.streams = [
+                torch.cuda.Stream(device=sw_device) for _ in range(self.num_streams)
+            ]
+        if self.streams or self.memory_format is not None:
+            network = partial(self._predict, network)
+        return super().__call__(inputs, network, *args, **kwargs)
+
+    def _predict(
+        self,
+        network: Callable[..., torch.Tensor],
+        windows: torch.Tensor,
+        *args: Any,
+        **kwargs: Any,
+    ) -> torch.Tensor:
+        """Predict a batch of windows in the configured memory format, split into one sub-batch per stream if streams are used.
+
+        Args:
+            network (Callable[..., torch.Tensor]): Target model to execute inference.
+            windows (torch.Tensor): Batch of windows.
+            *args (Any): Optional args to be passed to network.
+            **kwargs (Any): Optional keyword args to be passed to network.
+
+        Returns:
+            torch.Tensor: Predictions for the batch of windows.
+        """
+        if self.memory_format is not None:
+            # no-op if the gathered windows already are in the requested format
+            windows = windows.contiguous(memory_format=self.memory_format)
+        if not self.streams or windows.device.type != "cuda":
+            return network(windows, *args, **kwargs)
+        current_stream = torch.cuda.current_stream(windows.device)
+        sub_batches = windows.chunk(len(self.streams))
+        outputs = []
+        for stream, sub_batch in zip(self.streams, sub_batches):
+            # windows are gathered on the current stream
+            stream.wait_stream(current_stream)
+            with torch.cuda.stream(stream):
+                outputs.append(network(sub_batch, *args, **kwargs))
+            sub_batch.record_stream(stream)
+        # predictions are stitched on the current stream
+        for stream, output in zip(self.streams, outputs):
+            current_stream.wait_stream(stream)
+            output.record_stream(current_stream)
+        return torch.cat(outputs)
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import math
+from typing import Dict, Hashable, List, Mapping, Sequence, Tuple
+
+import nibabel as nib
+import numpy as np
+import torch
+from monai.config import KeysCollection
+from monai.transforms import MapTransform
+
+
+def _empty_float32(shape: Tuple[int, ...], pin_memory: bool = False) -> np.ndarray:
+    """Allocate an uninitialized float32 array.
+
+    Args:
+        shape (Tuple[int, ...]): Shape of the array.
+        pin_memory (bool, optional): Whether to allocate the array in page-locked memory (requires CUDA). Defaults to False.
+
+    Returns:
+        np.ndarray: Uninitialized array, a view of a pinned tensor if pin_memory is True.
+    """
+    if pin_memory:
+        return torch.empty(shape, dtype=torch.float32, pin_memory=True).numpy()
+    return np.empty(shape, dtype=np.float32)
+
+
+def percentiles(values: torch.Tensor, q: Sequence[float]) -> List[float]:
+    """Compute percentiles of all values of a tensor on its device.\n
+    Linearly interpolates between the closest ranks like np.percentile (torch.quantile is limited to 16M elements).
+
+    Args:
+        values (torch.Tensor): Values without NaNs.
+        q (Sequence[float]): Percentiles (range 0-100).
+
+    Returns:
+        List[float]: Percentiles of the values.
+    """
+    sorted_values = values.flatten().sort().values
+    n = sorted_values.numel()
+    positions = [percentile / 100 * (n - 1) for percentile in q]
+    lower_ranks = [math.floor(position) for position in positions]
+    lower_values = sorted_values[lower_ranks]
+    upper_values = sorted_values[[min(rank + 1, n - 1) for rank in lower_ranks]]
+    # same as numpy: the difference is computed in the dtype of the values, a single transfer of all neighbouring values
+    a, b, diff = torch.stack(
+        [lower_values, upper_values, upper_values - lower_values]
+    ).tolist()
+    result = []
+    for i, (position, rank) in enumerate(zip(positions, lower_ranks)):
+        t = position - rank
+        # same (symmetric) linear interpolation as numpy
+        result.append(a[i] + diff[i] * t if t < 0.5 else b[i] - diff[i] * (1 - t))
+    return result
+
+
+def scale_intensity_percentiles_(
+    images: torch.Tensor, lower: float, upper: float
+) -> torch.Tensor:
+    """Channel-wise scale the intensities of a (B, C, H, W, D) tensor in place like ScaleIntensityPercentilesd, e.g. on the GPU after the transfer.
+
+    Args:
+        images (torch.Tensor): Images without NaNs.
+        lower (float): Lower percentile (range 0-100).
+        upper (float): Upper percentile (range 0-100).
+
+    Returns:
+        torch.Tensor: The scaled images.
+    """
+    # indexing always returns views, i.e. the channels are modified in place regardless of the memory layout
+    for image in images:
+        for channel in image:
+            a_min, a_max = percentiles(channel, [lower, upper])
+            channel.sub_(a_min)
+            # same as monai: constant channels are only shifted
+            if a_max - a_min != 0.0:
+                channel.div_(a_max - a_min).clamp_(0, 1)
+    return images
+
+
+class LoadNiftid(MapTransform):
+    """Load the NIfTI file(s) of each key and stack them into a single channel-first (C, H, W, D) float32 array.\n
+    Reads the voxel data directly through nibabel's array proxy, bypassing monai's generic image reader stack.
+    Compressed files are read with indexed_gzip if the optional package is installed.
+    """
+
+    def __init__(
+        self,
+        keys: KeysCollection,
+        pin_memory: bool = False,
+        allow_missing_keys: bool = False,
+    ) -> None:
+        """Initialize the transform.
+
+        Args:
+            keys (KeysCollection): Keys of the corresponding items to be transformed.
+            pin_memory (bool, optional): Whether to read the images into page-locked memory (requires CUDA). Defaults to False.
+            allow_missing_keys (bool, optional): Don't raise exception if key is missing. Defaults to False.
+        """
+        super().__init__(keys=keys, allow_missing_keys=allow_missing_keys)
+        self.pin_memory = pin_memory
+
+    def __call__(self, data: Mapping[Hashable, list]) -> Dict[Hashable, np.ndarray]:
+        """Load the images.
+
+        Args:
+            data (Mapping[Hashable, list]): Data dictionary mapping each key to a list of NIfTI file paths.
+
+        Returns:
+            Dict[Hashable, np.ndarray]: Data dictionary with the file paths replaced by the stacked image array.
+        """
+        d = dict(data)
+        for key in self.key_iterator(d):
+            images = [nib.load(str(path)) for path in d[key]]
+            stacked = _empty_float32(
+                (len(images), *images[0].shape), pin_memory=self.pin_memory
+            )
+            for channel, image in enumerate(images):
+                # assigning the array proxy reads and scales the voxel data straight into the output buffer
+                stacked[channel] = image.dataobj
+            d[key] = stacked
+        return d
+
+
+class ScaleIntensityPercentilesd(MapTransform):
+    """Channel-wise scale the intensities of each key from the [lower, upper] percentile range to [0, 1] and clip to [0, 1].\n
+    Equivalent to monai's ScaleIntensityRangePercentilesd(b_min=0, b_max=1, clip=True, relative=False, channel_wise=True)
+    but determines both percentiles with a single partition of the channel and scales the data in place using torch's multithreaded CPU kernels.
+    """
+
+    def __init__(
+        self,
+        keys: KeysCollection,
+        lower: float,
+        upper: float,
+        allow_missing_keys: bool = False,
+    ) -> None:
+        """Initialize the transform.
+
+        Args:
+            keys (KeysCollection): Keys of the corresponding items to be transformed.
+            lower (float): Lower percentile (range 0-100).
+            upper (float): Upper percentile (range 0-100).
+            allow_missing_keys (bool, optional): Don't raise exception if key is missing. Defaults to False.
+        """
+        super().__init__(keys=keys, allow_missing_keys=allow_missing_keys)
+        self.lower = lower
+        self.upper = upper
+
+    def _scale_channel(self, channel: np.ndarray) -> None:
+        """Scale a single float32 channel in place.
+
+        Args:
+            channel (np.ndarray): Channel to scale.
+        """
+        a_min, a_max = (
+            float(p) for p in np.percentile(channel, [self.lower, self.upper])
+        )
+        # shares the memory of the channel, numpy's elementwise ops are single threaded
+        channel_tensor = torch.from_numpy(channel)
+        channel_tensor.sub_(a_min)
+        # same as monai: constant channels are only shifted
+        if a_max - a_min != 0.0:
+            channel_tensor.div_(a_max - a_min).clamp_(0, 1)
+
+    def __call__(
+        self, data: Mapping[Hashable, np.ndarray]
+    ) -> Dict[Hashable, np.ndarray]:
+        """Scale the intensities. The (C, H, W, D) float32 arrays are modified in place.
+
+        Args:
+            data (Mapping[Hashable, np.ndarray]): Data dictionary.
+
+        Returns:
+            Dict[Hashable, np.ndarray]: Data dictionary with scaled intensities.
+        """
+        d = dict(data)
+        for key in self.key_iterator(d):
+            img = np.asarray(d[key], dtype=np.float32)
+            for channel in img:
+                self._scale_channel(channel)
+            d[key] = img
+        return d
+
+
+class PreprocessImagesd(ScaleIntensityPercentilesd):
+    """Fused preprocessing of the model input: replace NaN/inf values (np.nan_to_num), channel-wise percentile scaling and conversion to a torch tensor.\n
+    Equivalent to Lambdad(np.nan_to_num), ScaleIntensityPercentilesd and ToTensord but processes each channel in a single sweep
+    instead of walking the whole volume once per transform. The scaling can be skipped to apply it on the GPU instead (see scale_intensity_percentiles_).
+    """
+
+    def __init__(
+        self,
+        keys: KeysCollection,
+        lower: float,
+        upper: float,
+        pin_memory: bool = False,
+        scale_intensities: bool = True,
+        allow_missing_keys: bool = False,
+    ) -> None:
+        """Initialize the transform.
+
+        Args:
+            keys (KeysCollection): Keys of the corresponding items to be transformed.
+            lower (float): Lower percentile (range 0-100).
+            upper (float): Upper percentile (range 0-100).
+            pin_memory (bool, optional): Whether sequences of channels are stacked into page-locked memory (requires CUDA), arrays are processed in place. Defaults to False.
+            scale_intensities (bool, optional): Whether to apply the percentile scaling. Defaults to True.
+            allow_missing_keys (bool, optional): Don't raise exception if key is missing. Defaults to False.
+        """
+        super().__init__(
+            keys=keys, lower=lower, upper=upper, allow_missing_keys=allow_missing_keys
+        )
+        self.pin_memory = pin_memory
+        self.scale_intensities = scale_intensities
+
+    def __call__(
+        self, data: Mapping[Hashable, np.ndarray | Sequence[np.ndarray]]
+    ) -> Dict[Hashable, torch.Tensor]:
+        """Preprocess the images. (C, H, W, D) float32 arrays are modified in place, sequences of channels are stacked into a new array first.
+
+        Args:
+            data (Mapping[Hashable, np.ndarray | Sequence[np.ndarray]]): Data dictionary.
+
+        Returns:
+            Dict[Hashable, torch.Tensor]: Data dictionary with the preprocessed images as tensors.
+        """
+        d = dict(data)
+        for key in self.key_iterator(d):
+            img = d[key]
+            if isinstance(img, np.ndarray):
+                img = np.asarray(img, dtype=np.float32)
+            else:
+                # stacking copies, the (user provided) channels are never modified
+                channels = img
+                img = _empty_float32(
+                    (len(channels), *channels[0].shape), pin_memory=self.pin_memory
+                )
+                for i, channel in enumerate(channels):
+                    img[i] = channel
+            for channel in img:
+                torch.from_numpy(channel).nan_to_num_()
+                if self.scale_intensities:
+                    self._scale_channel(channel)
+            d[key] = torch.from_numpy(img)
+        return d
@@ -1,10 +1,15 @@
+import itertools
 from pathlib import Path
 
 import nibabel as nib
 import numpy as np
 import pytest
 from brainles_aurora.inferer.config import AuroraInfererConfig
-from brainles_aurora.inferer.constants import InferenceMode
+from brainles_aurora.inferer.constants import (
+    IMGS_TO_MODE_DICT,
+    MODALITIES,
+    InferenceMode,
+)
 from brainles_aurora.inferer.data import DataHandler
 
 
@@ -76,12 +81,42 @@ class TestDataHandler:
         assert len(images) == 4
         assert all(isinstance(img, Path) for img in images)
 
+    def test_validate_images_pathlib(self, t1_path, mock_data_handler):
+        images = mock_data_handler.validate_images(t1=Path(t1_path))
+        assert images[0] == Path(t1_path).absolute()
+
+    def test_validate_images_invalid_extension(self, mock_data_handler, tmp_path):
+        invalid_file = tmp_path / "t1.npy"
+        invalid_file.touch()
+        with pytest.raises(ValueError):
+            _ = mock_data_handler.validate_images(t1=invalid_file)
+
+    def test_validate_images_numpy_float32_not_copied(self, mock_data_handler):
+        t1 = np.zeros((4, 4, 4), dtype=np.float32)
+        images = mock_data_handler.validate_images(t1=t1)
+        assert images[0] is t1
+
+    def test_validate_images_resets_previous_validation(
+        self, t1_path, mock_data_handler
+    ):
+        mock_data_handler.validate_images(t1=t1_path)
+        with pytest.raises(FileNotFoundError):
+            mock_data_handler.validate_images(t1="invalid_path.nii.gz")
+        assert mock_data_handler._not_none_images is None
+        with pytest.raises(AssertionError):
+            mock_data_handler.get_input_mode()
+        mock_data_handler.validate_images(t1=np.zeros((4, 4, 4), dtype=np.float32))
+        with pytest.raises(AssertionError):
+            mock_data_handler.get_reference_nifti_file()
+
     def test_validate_images_file_not_found(
         self,
         mock_data_handler,
     ):
-        with pytest.raises(FileNotFoundError):
+        with pytest.raises(FileNotFoundError) as exc_info:
             _ = mock_data_handler.validate_images(t1="invalid_path.nii.gz")
+        # no chained traceback of the internal os.stat error
+        assert exc_info.value.__suppress_context__
 
     def test_validate_images_different_types(
         self,
@@ -119,3 +154,67 @@ class TestDataHandler:
         images = mock_data_handler.validate_images(t2=t2_path)
         with pytest.raises(NotImplementedError):
             _ = mock_data_handler.determine_inference_mode(images=images)
+
+    @pytest.mark.parametrize(
+        "present", list(itertools.product([False, True], repeat=4))[1:]
+    )
+    def test_determine_inference_mode_all_combinations(
+        self, mock_data_handler, t1_path, present
+    ):
+        images = mock_data_handler.validate_images(
+            **{m: t1_path for m, p in zip(MODALITIES, present) if p}
+        )
+        expected = IMGS_TO_MODE_DICT.get(present)
+        if expected is None:
+            with pytest.raises(NotImplementedError):
+                mock_data_handler.determine_inference_mode(images=images)
+        else:
+            assert mock_data_handler.determine_inference_mode(images=images) == expected
+
+    def test_get_data_loader_without_workers_matches_data_loader(
+        self, t1_path, t1c_path, mock_data_handler
+    ):
+        images = mock_data_handler.validate_images(t1=t1_path, t1c=t1c_path)
+        batches = mock_data_handler.get_data_loader(images=images)
+        assert isinstance(batches, list) and len(batches) == 1
+        mock_data_handler.config.workers = 1
+        loader_batches = list(mock_data_handler.get_data_loader(images=images))
+        assert len(loader_batches) == 1
+        assert batches[0]["images"].shape == (1, 2, *nib.load(t1_path).shape)
+        np.testing.assert_array_equal(
+            np.asarray(batches[0]["images"]), np.asarray(loader_batches[0]["images"])
+        )
+
+    @pytest.mark.parametrize(
+        "compression_level,file_name",
+        [(0, "seg.nii.gz"), (1, "seg.nii.gz"), (1, "seg.nii")],
+    )
+    def test_save_as_nifti(
+        self, t1_path, mock_data_handler, tmp_path, compression_level, file_name
+    ):
+        mock_data_handler.config.compression_level = compression_level
+        mock_data_handler.validate_images(t1=t1_path)
+        seg = np.zeros(nib.load(t1_path).shape, dtype=np.uint8)
+        seg[10:20, 10:20, 10:20] = 2
+        output_file = tmp_path / file_name
+        mock_data_handler.save_as_nifti(
+            postproc_data={"segmentation": seg},
+            output_file_mapping={"segmentation": str(output_file)},
+        )
+        saved = nib.load(output_file)
+        np.testing.assert_array_equal(np.asanyarray(saved.dataobj), seg)
+        np.testing.assert_array_equal(saved.affine, nib.load(t1_path).affine)
+
+    def test_save_as_nifti_without_waiting(self, t1_path, mock_data_handler, tmp_path):
+        mock_data_handler.validate_images(t1=t1_path)
+        output_file_mapping = {"segmentation": str(tmp_path / "seg.nii.gz")}
+        futures = mock_data_handler.save_as_nifti(
+            postproc_data={"segmentation": np.ones((4, 4, 4), dtype=np.uint8)},
+            output_file_mapping=output_file_mapping,
+            wait=False,
+        )
+        assert futures.keys() == {"segmentation"}
+        mock_data_handler.wait_for_saves(
+            futures=futures, output_file_mapping=output_file_mapping
+        )
+        assert (tmp_path / "seg.nii.gz").exists()
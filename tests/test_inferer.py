@@ -1,3 +1,6 @@
+import logging
+import subprocess
+import sys
 from unittest.mock import patch
 
 import pytest
@@ -41,3 +44,23 @@ class TestAuroraInferer:
         inferer = AuroraInferer()
         device = inferer._configure_device()
         assert device == torch.device("cuda")
+
+    def test_log_file_handler_kept_by_new_inferer(self, tmp_path):
+        inferer = AuroraInferer(config=AuroraInfererConfig(device=Device.CPU))
+        inferer._set_log_file(tmp_path / "first.log")
+        AuroraInferer(config=AuroraInfererConfig(device=Device.CPU))
+        try:
+            assert inferer.log_file_handler in logging.getLogger().handlers
+        finally:
+            logging.getLogger().removeHandler(inferer.log_file_handler)
+            inferer.log_file_handler.close()
+
+    def test_config_import_does_not_import_torch(self):
+        subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys; from brainles_aurora.inferer import AuroraInfererConfig; assert 'torch' not in sys.modules",
+            ],
+            check=True,
+        )
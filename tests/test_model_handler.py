@@ -1,10 +1,356 @@
+import pickle
+import sys
+from unittest.mock import MagicMock, patch
+
+import numpy as np
 import pytest
+import torch
+from brainles_aurora.inferer.config import AuroraInfererConfig
+from brainles_aurora.inferer.constants import (
+    Device,
+    InferenceMode,
+    ModelSelection,
+    Output,
+    Precision,
+)
 from brainles_aurora.inferer.model import ModelHandler
+from monai.networks.nets import BasicUNet
 
 
 class TestModelHandler:
-    def mock_model_handler(self, mock_config):
-        return ModelHandler(config=mock_config)
+    @pytest.fixture
+    def mock_config(self):
+        return AuroraInfererConfig(device=Device.CPU)
+
+    @pytest.fixture
+    def mock_model_handler(self, mock_config, tmp_path):
+        with patch("brainles_aurora.inferer.model.download_model_weights"):
+            model_handler = ModelHandler(config=mock_config, device=torch.device("cpu"))
+        model_handler.model_weights_folder = tmp_path
+        return model_handler
+
+    @pytest.fixture
+    def dataparallel_state_dict(self):
+        model = BasicUNet(
+            spatial_dims=3,
+            in_channels=1,
+            out_channels=2,
+            features=(32, 32, 64, 128, 256, 32),
+            dropout=0.1,
+            act="mish",
+        )
+        return {f"module.{k}": v for k, v in model.state_dict().items()}
+
+    def test_load_model(
+        self, mock_model_handler, mock_config, dataparallel_state_dict, tmp_path
+    ):
+        torch.save(
+            {"model_state": dataparallel_state_dict},
+            tmp_path / f"{InferenceMode.T1_O}_{mock_config.model_selection}.tar",
+        )
+        mock_model_handler.load_model(
+            inference_mode=InferenceMode.T1_O, num_input_modalities=1
+        )
+        state_dict = mock_model_handler.model.state_dict()
+        assert state_dict.keys() == {
+            k.replace("module.", "", 1) for k in dataparallel_state_dict
+        }
+        assert all(
+            torch.equal(v, dataparallel_state_dict[f"module.{k}"])
+            for k, v in state_dict.items()
+        )
+
+    @pytest.mark.skipif(
+        not torch.cuda.is_available(),
+        reason="Skipping compiled multi stream test since cuda is not available",
+    )
+    def test_compiled_model_with_multiple_streams(
+        self, dataparallel_state_dict, tmp_path
+    ):
+        torch.save(
+            {"model_state": dataparallel_state_dict},
+            tmp_path / f"{InferenceMode.T1_O}_{ModelSelection.BEST}.tar",
+        )
+        inputs = torch.rand(1, 1, 64, 64, 64)
+        results = []
+        for compile, num_streams in [(False, 1), (True, 2)]:
+            config = AuroraInfererConfig(
+                device=Device.GPU,
+                tta=False,
+                crop_size=(32, 32, 32),
+                sliding_window_batch_size=4,
+                num_streams=num_streams,
+                compile=compile,
+                precision=Precision.FP32,
+            )
+            with patch("brainles_aurora.inferer.model.download_model_weights"):
+                model_handler = ModelHandler(config=config, device=torch.device("cuda"))
+            model_handler.model_weights_folder = tmp_path
+            model_handler.load_model(
+                inference_mode=InferenceMode.T1_O, num_input_modalities=1
+            )
+            results.append(
+                model_handler._sliding_window_inference([{"images": inputs}])
+            )
+        for key, expected in results[0].items():
+            # compiled kernels may round differently
+            assert np.mean(results[1][key] != expected) < 1e-3
+
+    def test_load_legacy_checkpoint(self, mock_model_handler, tmp_path):
+        weights_path = tmp_path / "legacy.tar"
+        torch.save(
+            {"model_state": {"weight": torch.ones(2)}},
+            weights_path,
+            _use_new_zipfile_serialization=False,
+        )
+        checkpoint = mock_model_handler._load_checkpoint(weights_path=weights_path)
+        assert torch.equal(checkpoint["model_state"]["weight"], torch.ones(2))
+
+    def test_load_checkpoint_rejects_arbitrary_objects(
+        self, mock_model_handler, tmp_path
+    ):
+        weights_path = tmp_path / "objects.tar"
+        torch.save({"model_state": {}, "config": AuroraInfererConfig()}, weights_path)
+        with pytest.raises(pickle.UnpicklingError):
+            mock_model_handler._load_checkpoint(weights_path=weights_path)
+
+    def test_load_model_missing_weights(self, mock_model_handler):
+        with pytest.raises(NotImplementedError):
+            mock_model_handler.load_model(
+                inference_mode=InferenceMode.T1_O, num_input_modalities=1
+            )
+
+    @pytest.mark.parametrize("threshold", [0.0, 0.3, 0.5, 1.0])
+    def test_post_process(self, mock_model_handler, threshold):
+        mock_model_handler.config.threshold = threshold
+        outputs = torch.randn(1, 2, 8, 8, 8) * 4
+        postprocessed = mock_model_handler._post_process(outputs)
+        binarized = (outputs[0].sigmoid() >= threshold).numpy()
+        expected_seg = binarized[0].astype(np.uint8)
+        expected_seg[binarized[1]] = 2
+        np.testing.assert_array_equal(postprocessed[Output.SEGMENTATION], expected_seg)
+        np.testing.assert_array_equal(postprocessed[Output.WHOLE_NETWORK], binarized[0])
+        np.testing.assert_array_equal(
+            postprocessed[Output.METASTASIS_NETWORK], binarized[1]
+        )
+        assert all(v.dtype == np.uint8 for v in postprocessed.values())
+
+    def test_determine_sliding_window_batch_size(self, mock_model_handler):
+        assert mock_model_handler._determine_sliding_window_batch_size() == 1
+        mock_model_handler.config.sliding_window_batch_size = 3
+        assert mock_model_handler._determine_sliding_window_batch_size() == 3
+
+    def test_determine_sliding_window_batch_size_from_gpu_memory(
+        self, mock_model_handler
+    ):
+        mock_model_handler.device = torch.device("cuda")
+        with patch("torch.cuda.mem_get_info", return_value=(2**40, 2**40)):
+            large = mock_model_handler._determine_sliding_window_batch_size()
+        with patch("torch.cuda.mem_get_info", return_value=(0, 2**40)):
+            small = mock_model_handler._determine_sliding_window_batch_size()
+        assert large > 1
+        assert small == 1
+
+    def test_determine_sliding_window_batch_size_counts_cached_memory(
+        self, mock_model_handler
+    ):
+        mock_model_handler.device = torch.device("cuda")
+        with patch("torch.cuda.mem_get_info", return_value=(0, 2**40)), patch(
+            "torch.cuda.memory_reserved", return_value=2**40
+        ), patch("torch.cuda.memory_allocated", return_value=2**30):
+            # memory cached by PyTorch's allocator (e.g. from a previous inference) is reusable
+            assert mock_model_handler._determine_sliding_window_batch_size() > 1
+
+    def test_load_model_releases_previous_model(
+        self, mock_model_handler, mock_config, dataparallel_state_dict, tmp_path
+    ):
+        torch.save(
+            {"model_state": dataparallel_state_dict},
+            tmp_path / f"{InferenceMode.T1_O}_{mock_config.model_selection}.tar",
+        )
+        mock_model_handler.model = previous_model = torch.nn.Identity()
+        mock_model_handler.inference_mode = InferenceMode.T1C_O
+
+        def determine_sliding_window_batch_size():
+            # the previous model must not hold memory while measuring
+            assert mock_model_handler.model is None
+            return 1
+
+        with patch.object(
+            mock_model_handler,
+            "_determine_sliding_window_batch_size",
+            side_effect=determine_sliding_window_batch_size,
+        ):
+            mock_model_handler.load_model(
+                inference_mode=InferenceMode.T1_O, num_input_modalities=1
+            )
+        assert mock_model_handler.model is not previous_model
+
+    def test_load_model_redetermines_batch_size_on_config_change(
+        self, mock_model_handler, mock_config, dataparallel_state_dict, tmp_path
+    ):
+        torch.save(
+            {"model_state": dataparallel_state_dict},
+            tmp_path / f"{InferenceMode.T1_O}_{mock_config.model_selection}.tar",
+        )
+        # (configured batch size, tta, whether the batch size is determined again)
+        for sliding_window_batch_size, tta, redetermined in [
+            (2, True, True),
+            (2, True, False),
+            (3, True, True),
+            (3, False, True),
+        ]:
+            mock_config.sliding_window_batch_size = sliding_window_batch_size
+            mock_config.tta = tta
+            with patch.object(
+                mock_model_handler,
+                "_determine_sliding_window_batch_size",
+                wraps=mock_model_handler._determine_sliding_window_batch_size,
+            ) as determine:
+                mock_model_handler.load_model(
+                    inference_mode=InferenceMode.T1_O, num_input_modalities=1
+                )
+            assert determine.called == redetermined
+            assert (
+                mock_model_handler.sliding_window_batch_size
+                == sliding_window_batch_size
+            )
+
+    def test_determine_sliding_window_batch_size_for_tensorrt(self, mock_model_handler):
+        mock_model_handler.device = torch.device("cuda")
+        mock_model_handler.config.tensorrt = True
+        batch_sizes = set()
+        for free_memory in range(2**33, 2**34, 2**30):
+            with patch("torch.cuda.mem_get_info", return_value=(free_memory, 2**40)):
+                batch_sizes.add(
+                    mock_model_handler._determine_sliding_window_batch_size()
+                )
+        # powers of two, i.e. the same (cached) engine for similar free memory
+        assert all(b & (b - 1) == 0 for b in batch_sizes)
+        assert len(batch_sizes) <= 2
+
+    def test_sliding_window_inferer_is_cached(self, mock_model_handler):
+        inferer = mock_model_handler._get_sliding_window_inferer(sw_batch_size=2)
+        assert (
+            mock_model_handler._get_sliding_window_inferer(sw_batch_size=2) is inferer
+        )
+        assert (
+            mock_model_handler._get_sliding_window_inferer(sw_batch_size=3)
+            is not inferer
+        )
+        mock_model_handler.config.sliding_window_overlap = 0.25
+        assert (
+            mock_model_handler._get_sliding_window_inferer(sw_batch_size=2)
+            is not inferer
+        )
+
+    def test_apply_test_time_augmentations(self, mock_model_handler):
+        mock_model_handler.sliding_window_batch_size = 1
+        inputs = torch.randn(1, 2, 5, 6, 7)
+        # identity "model" without noise: every un-flipped view equals the input
+        with patch.object(
+            mock_model_handler,
+            "_get_sliding_window_inferer",
+            return_value=lambda views, model: views.clone(),
+        ), patch(
+            "brainles_aurora.inferer.model.RandGaussianNoised",
+            return_value=lambda data: data,
+        ):
+            outputs = mock_model_handler._apply_test_time_augmentations(
+                inputs.clone(), inputs
+            )
+        torch.testing.assert_close(outputs, inputs)
+
+    def test_load_model_from_safetensors_cache(
+        self, mock_model_handler, mock_config, dataparallel_state_dict, tmp_path
+    ):
+        pytest.importorskip("safetensors")
+        weights_path = (
+            tmp_path / f"{InferenceMode.T1_O}_{mock_config.model_selection}.tar"
+        )
+        torch.save({"model_state": dataparallel_state_dict}, weights_path)
+        state_dict = mock_model_handler._load_state_dict(weights_path=weights_path)
+        assert weights_path.with_suffix(".safetensors").exists()
+        with patch.object(mock_model_handler, "_load_checkpoint") as load_checkpoint:
+            cached_state_dict = mock_model_handler._load_state_dict(
+                weights_path=weights_path
+            )
+        load_checkpoint.assert_not_called()
+        assert cached_state_dict.keys() == state_dict.keys()
+        assert all(torch.equal(cached_state_dict[k], v) for k, v in state_dict.items())
+
+    def test_load_model_from_corrupt_safetensors_cache(
+        self, mock_model_handler, mock_config, dataparallel_state_dict, tmp_path
+    ):
+        pytest.importorskip("safetensors")
+        weights_path = (
+            tmp_path / f"{InferenceMode.T1_O}_{mock_config.model_selection}.tar"
+        )
+        torch.save({"model_state": dataparallel_state_dict}, weights_path)
+        cache_path = weights_path.with_suffix(".safetensors")
+        cache_path.write_bytes(b"corrupt")
+        state_dict = mock_model_handler._load_state_dict(weights_path=weights_path)
+        assert all(
+            torch.equal(v, dataparallel_state_dict[f"module.{k}"])
+            for k, v in state_dict.items()
+        )
+        # the corrupt cache is replaced, no temporary files are left behind
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            cache_path.name,
+            weights_path.name,
+        ]
+        cached_state_dict = mock_model_handler._load_state_dict(
+            weights_path=weights_path
+        )
+        assert cached_state_dict.keys() == state_dict.keys()
+
+    def test_get_input_dtype(self, mock_model_handler):
+        mock_model_handler.config.half_precision_outputs = True
+        # full precision inference on CPU
+        assert mock_model_handler._get_input_dtype() == torch.float32
+        mock_model_handler.device = torch.device("cuda")
+        assert mock_model_handler._get_input_dtype() == torch.float16
+        mock_model_handler.config.precision = Precision.BF16
+        with patch("torch.cuda.is_bf16_supported", return_value=True):
+            assert mock_model_handler._get_input_dtype() == torch.float32
+        mock_model_handler.config.precision = Precision.FP16
+        mock_model_handler.config.half_precision_outputs = False
+        assert mock_model_handler._get_input_dtype() == torch.float32
+
+    @pytest.fixture
+    def mock_torch_tensorrt(self):
+        torch_tensorrt = MagicMock()
+        torch_tensorrt.compile.return_value = torch.jit.script(torch.nn.Identity())
+        with patch.dict(sys.modules, {"torch_tensorrt": torch_tensorrt}), patch(
+            "torch.cuda.get_device_capability", return_value=(8, 0)
+        ):
+            yield torch_tensorrt
 
+    @pytest.mark.parametrize("writable", [True, False])
+    def test_load_tensorrt_model_saves_engine(
+        self, mock_model_handler, mock_torch_tensorrt, tmp_path, writable
+    ):
+        mock_model_handler.device = torch.device("cuda")
+        mock_model_handler.inference_mode = InferenceMode.T1_O
+        mock_model_handler.sliding_window_batch_size = 1
+        if writable:
+            trt_model = mock_model_handler._load_tensorrt_model(
+                model=torch.nn.Identity(), num_input_modalities=1
+            )
+        else:
+            # e.g. read-only weights folder
+            with patch("torch.jit.save", side_effect=PermissionError("read-only")):
+                trt_model = mock_model_handler._load_tensorrt_model(
+                    model=torch.nn.Identity(), num_input_modalities=1
+                )
+        assert trt_model is mock_torch_tensorrt.compile.return_value
+        # no partially written engines are left behind
+        assert [p.suffix for p in tmp_path.iterdir()] == ([".ts"] if writable else [])
 
-# TODO: add tests
+    def test_bf16_fallback_warns_once(self, mock_model_handler, caplog):
+        mock_model_handler.device = torch.device("cuda")
+        mock_model_handler.config.precision = Precision.BF16
+        with patch("torch.cuda.is_bf16_supported", return_value=False):
+            for _ in range(3):
+                assert mock_model_handler._get_autocast_dtype() == torch.float16
+        assert caplog.text.count("falling back") == 1
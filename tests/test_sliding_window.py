@@ -0,0 +1,64 @@
+import pytest
+import torch
+from brainles_aurora.inferer.sliding_window import MultiStreamSlidingWindowInferer
+from monai.inferers import SlidingWindowInferer
+
+
+class TestMultiStreamSlidingWindowInferer:
+    @pytest.fixture
+    def inferer_kwargs(self):
+        return dict(roi_size=(8, 8, 8), sw_batch_size=4, overlap=0.5, mode="gaussian")
+
+    @pytest.fixture
+    def network(self):
+        torch.manual_seed(0)
+        return torch.nn.Conv3d(2, 2, kernel_size=3, padding=1)
+
+    def _infer(self, inferer, network, device):
+        inputs = torch.rand(
+            1, 2, 20, 17, 12, generator=torch.Generator().manual_seed(0)
+        )
+        with torch.inference_mode():
+            if isinstance(network, torch.nn.Module):
+                network = network.to(device)
+            return inferer(inputs.to(device), network).cpu()
+
+    def test_matches_sliding_window_inferer_on_cpu(self, inferer_kwargs, network):
+        expected = self._infer(SlidingWindowInferer(**inferer_kwargs), network, "cpu")
+        outputs = self._infer(
+            MultiStreamSlidingWindowInferer(**inferer_kwargs, num_streams=3),
+            network,
+            "cpu",
+        )
+        torch.testing.assert_close(outputs, expected)
+
+    def test_memory_format(self, inferer_kwargs, network):
+        memory_formats = []
+
+        def _network(windows):
+            memory_formats.append(
+                windows.is_contiguous(memory_format=torch.channels_last_3d)
+            )
+            return network(windows)
+
+        expected = self._infer(SlidingWindowInferer(**inferer_kwargs), network, "cpu")
+        outputs = self._infer(
+            MultiStreamSlidingWindowInferer(
+                **inferer_kwargs, memory_format=torch.channels_last_3d
+            ),
+            _network,
+            "cpu",
+        )
+        assert memory_formats and all(memory_formats)
+        torch.testing.assert_close(outputs, expected)
+
+    @pytest.mark.skipif(
+        not torch.cuda.is_available(),
+        reason="Skipping multi stream test since cuda is not available",
+    )
+    def test_matches_sliding_window_inferer_on_gpu(self, inferer_kwargs, network):
+        expected = self._infer(SlidingWindowInferer(**inferer_kwargs), network, "cuda")
+        inferer = MultiStreamSlidingWindowInferer(**inferer_kwargs, num_streams=3)
+        outputs = self._infer(inferer, network, "cuda")
+        assert len(inferer.streams) == 3
+        torch.testing.assert_close(outputs, expected)
@@ -0,0 +1,109 @@
+import nibabel as nib
+import numpy as np
+import pytest
+import torch
+from brainles_aurora.inferer.transforms import (
+    LoadNiftid,
+    PreprocessImagesd,
+    ScaleIntensityPercentilesd,
+    percentiles,
+    scale_intensity_percentiles_,
+)
+from monai.transforms import ScaleIntensityRangePercentilesd
+
+
+class TestTransforms:
+    @pytest.fixture
+    def t1_path(self):
+        return "example/data/BraTS-MET-00110-000-t1n.nii.gz"
+
+    @pytest.fixture
+    def t1c_path(self):
+        return "example/data/BraTS-MET-00110-000-t1c.nii.gz"
+
+    def test_load_niftid(self, t1_path, t1c_path):
+        data = LoadNiftid(keys=["images"])({"images": [t1_path, t1c_path]})
+        images = data["images"]
+        assert images.dtype == np.float32
+        assert images.flags.c_contiguous
+        assert images.shape == (2, *nib.load(t1_path).shape)
+        np.testing.assert_array_equal(images[1], nib.load(t1c_path).get_fdata())
+
+    def test_load_niftid_single_image_is_channel_first(self, t1_path):
+        data = LoadNiftid(keys=["images"])({"images": [t1_path]})
+        assert data["images"].shape == (1, *nib.load(t1_path).shape)
+
+    def test_scale_intensity_percentilesd_matches_monai(self):
+        images = np.random.default_rng(0).normal(size=(3, 20, 20, 10)) * 100
+        images[2] = 7  # constant channel
+        images = images.astype(np.float32)
+        expected = ScaleIntensityRangePercentilesd(
+            keys="images",
+            lower=0.5,
+            upper=99.5,
+            b_min=0,
+            b_max=1,
+            clip=True,
+            relative=False,
+            channel_wise=True,
+        )({"images": images.copy()})["images"]
+        scaled = ScaleIntensityPercentilesd(keys="images", lower=0.5, upper=99.5)(
+            {"images": images}
+        )["images"]
+        np.testing.assert_allclose(scaled, np.asarray(expected), rtol=0, atol=1e-6)
+
+    def test_preprocess_imagesd_matches_unfused(self):
+        channels = list(
+            np.random.default_rng(0).normal(size=(2, 20, 20, 10)).astype(np.float32)
+        )
+        channels[0][0, 0, 0] = np.nan
+        channels[1][1, 1, 1] = np.inf
+        originals = [channel.copy() for channel in channels]
+        expected = ScaleIntensityPercentilesd(keys="images", lower=0.5, upper=99.5)(
+            {"images": np.nan_to_num(np.stack(channels))}
+        )["images"]
+        preprocessed = PreprocessImagesd(keys="images", lower=0.5, upper=99.5)(
+            {"images": channels}
+        )["images"]
+        assert isinstance(preprocessed, torch.Tensor)
+        np.testing.assert_array_equal(preprocessed.numpy(), expected)
+        # the passed channels are left untouched
+        for channel, original in zip(channels, originals):
+            np.testing.assert_array_equal(channel, original)
+
+    @pytest.mark.skipif(
+        not torch.cuda.is_available(),
+        reason="Skipping pinned memory test since cuda is not available",
+    )
+    def test_preprocess_imagesd_pinned_memory(self, t1_path):
+        data = LoadNiftid(keys=["images"], pin_memory=True)({"images": [t1_path]})
+        assert torch.from_numpy(data["images"]).is_pinned()
+        channels = [np.ones((4, 4, 4), dtype=np.float32)]
+        preprocessed = PreprocessImagesd(
+            keys="images", lower=0.5, upper=99.5, pin_memory=True
+        )({"images": channels})["images"]
+        assert preprocessed.is_pinned()
+
+    def test_percentiles_match_numpy(self):
+        rng = np.random.default_rng(0)
+        for size in [1, 2, 7, 1000]:
+            values = (rng.normal(size=size) * 100).astype(np.float32)
+            np.testing.assert_array_equal(
+                percentiles(torch.from_numpy(values), [0.5, 30, 99.5]),
+                np.percentile(values, [0.5, 30, 99.5]),
+            )
+
+    def test_scale_intensity_percentiles_matches_preprocess_imagesd(
+        self, t1_path, t1c_path
+    ):
+        loaded = LoadNiftid(keys=["images"])({"images": [t1_path, t1c_path]})
+        expected = PreprocessImagesd(keys="images", lower=0.5, upper=99.5)(
+            {"images": loaded["images"].copy()}
+        )["images"]
+        unscaled = PreprocessImagesd(
+            keys="images", lower=0.5, upper=99.5, scale_intensities=False
+        )(loaded)["images"]
+        scaled = scale_intensity_percentiles_(
+            unscaled.unsqueeze(0), lower=0.5, upper=99.5
+        )
+        torch.testing.assert_close(scaled[0], expected, rtol=0, atol=0)